@@ -1,53 +1,72 @@
 
-from fastapi import FastAPI, Query
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-import json, os
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, StringConstraints, TypeAdapter
+from pydantic import ValidationError as PydanticValidationError
+from typing import List, Optional, Dict, Any, FrozenSet, Tuple, Set, Iterable, Type, Union, Annotated, get_args, get_origin
+import os
+import sys
+import threading
+from bisect import bisect_right
+import ahocorasick
+import numpy as np
+import orjson
+from numba import njit, prange
+from collections import defaultdict
+from dataclasses import dataclass
 from functools import lru_cache
 
-app = FastAPI(title="Doctor Agent PoC (EN/ZH)", version="0.1.0")
+app = FastAPI(title="Doctor Agent PoC (EN/ZH)", version="0.1.0", default_response_class=ORJSONResponse)
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# The bundled data is trusted and loaded without validation; set VALIDATE_DATA=1 to validate it while editing
+VALIDATE_DATA = os.environ.get("VALIDATE_DATA", "") not in ("", "0")
 
 # -----------------------
 # Models
 # -----------------------
 
-class Insurance(BaseModel):
+class FrozenModel(BaseModel):
+    # Loaded data and responses are never mutated; schemas are only built when something validates.
+    # Pydantic v2 models have no slots option, so frozen + defer_build is what applies here.
+    model_config = ConfigDict(frozen=True, defer_build=True)
+
+class Insurance(FrozenModel):
     payer_code: Optional[str] = None
     payer_name: Optional[str] = None
     plan: Optional[str] = None
     verified_at: Optional[str] = None
     source: Optional[str] = None
 
-class Portal(BaseModel):
+class Portal(FrozenModel):
     type: Optional[str] = None
     url: Optional[str] = None
 
-class Appointment(BaseModel):
+class Appointment(FrozenModel):
     phone: Optional[str] = None
     online_portals: Optional[List[Portal]] = None
     walk_in: Optional[bool] = None
 
-class Location(BaseModel):
+class Location(FrozenModel):
     clinic_name: Optional[str] = None
     address: Optional[str] = None
     city: Optional[str] = None
     state: Optional[str] = None
     zip: Optional[str] = None
 
-class Rating(BaseModel):
+class Rating(FrozenModel):
     source: Optional[str] = None
     rating: Optional[float] = None
     count: Optional[int] = None
     url: Optional[str] = None
 
-class Source(BaseModel):
+class Source(FrozenModel):
     source: Optional[str] = None
     url: Optional[str] = None
     crawled_at: Optional[str] = None
 
-class Doctor(BaseModel):
+class Doctor(FrozenModel):
     doctor_id: str
     full_name: str
     name_variants: Optional[List[str]] = None
@@ -63,100 +82,415 @@ class Doctor(BaseModel):
     locations: Optional[List[Location]] = None
     ratings: Optional[List[Rating]] = None
     last_updated: Optional[str] = None
-    sources: Optional[List[Source]] = None
+    # kept as raw dicts: sources are passed through to the response untouched (Source documents the shape)
+    sources: Optional[List[Dict[str, Any]]] = None
+
+    # Normalized copies of the searchable fields, filled once at load time
+    _norm_name: str = PrivateAttr(default="")
+    # normalized name and name variants joined by "\x01", so one substring test covers them all
+    _name_blob: str = PrivateAttr(default="")
+    _norm_cities: FrozenSet[str] = PrivateAttr(default=frozenset())
+    _norm_states: FrozenSet[str] = PrivateAttr(default=frozenset())
+    _norm_ins: Tuple[Tuple[str, str], ...] = PrivateAttr(default=())
+    _norm_langs: Tuple[str, ...] = PrivateAttr(default=())
+    # Response fragments, also filled once at load time
+    _ins_strings: List[str] = PrivateAttr(default_factory=list)
+    _appt_dump: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _loc0: Dict[str, Any] = PrivateAttr(default_factory=dict)
 
 # -----------------------
 # Data loaders
 # -----------------------
 
-@lru_cache(maxsize=1)
 def load_mapping() -> List[Dict[str, Any]]:
-    with open(os.path.join(DATA_DIR, "mapping.json"), "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(os.path.join(DATA_DIR, "mapping.json"), "rb") as f:
+        return orjson.loads(f.read())
 
-@lru_cache(maxsize=1)
 def load_doctors() -> List[Doctor]:
-    with open(os.path.join(DATA_DIR, "doctors.json"), "r", encoding="utf-8") as f:
-        raw = json.load(f)
-    return [Doctor(**d) for d in raw]
+    with open(os.path.join(DATA_DIR, "doctors.json"), "rb") as f:
+        raw = orjson.loads(f.read())
+    for d in raw:
+        _intern_record(d)
+    if VALIDATE_DATA:
+        doctors = TypeAdapter(List[Doctor]).validate_python(raw)
+    else:
+        doctors = [_construct(Doctor, d) for d in raw]
+    return [_index_doctor(d) for d in doctors]
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _intern_record(d: Dict[str, Any]):
+    # specialty, language, city, state and payer strings repeat across many doctors; share one copy of each
+    for key in ("specialties", "languages"):
+        if isinstance(d.get(key), list):
+            d[key] = [_intern(v) for v in d[key]]
+    for key, fields in (("locations", ("city", "state")), ("insurances", ("payer_code", "payer_name", "plan"))):
+        for item in d.get(key) or []:
+            if isinstance(item, dict):
+                for field in fields:
+                    if field in item:
+                        item[field] = _intern(item[field])
+
+def _construct(model: Type[BaseModel], data: Dict[str, Any]) -> BaseModel:
+    # model_construct() skips validation but does not build nested models, so walk the field types
+    values = {name: _construct_value(field.annotation, data[name])
+              for name, field in model.model_fields.items() if name in data}
+    return model.model_construct(**values)
+
+def _construct_value(tp: Any, value: Any) -> Any:
+    if value is None:
+        return None
+    origin = get_origin(tp)
+    if origin is Union:
+        return _construct_value(next(a for a in get_args(tp) if a is not type(None)), value)
+    if origin is list:
+        item_tp = get_args(tp)[0]
+        return [_construct_value(item_tp, v) for v in value]
+    if isinstance(tp, type) and issubclass(tp, BaseModel):
+        return _construct(tp, value)
+    return value
+
+@lru_cache(maxsize=8192)
+def _norm(s: str) -> str:
+    return s.strip().lower()
 
 def normalize(s: Optional[str]) -> str:
     if not s:
         return ""
-    return s.strip().lower()
+    return _norm(s)
 
-def detect_specialties_from_query(q: str) -> List[str]:
-    qn = normalize(q)
-    specs = set()
-    # if q looks like a specialty directly
-    for d in load_doctors():
+def _norm_key(s: Optional[str]) -> str:
+    # interned so equal index keys from different spellings are one object
+    return sys.intern(normalize(s))
+
+def _index_doctor(d: Doctor) -> Doctor:
+    locs = [loc for loc in (d.locations or []) if loc]
+    ins = [(_norm_key(i.payer_code), _norm_key(i.payer_name)) for i in (d.insurances or [])]
+    d._norm_name = normalize(d.full_name)
+    d._name_blob = "\x01".join([d._norm_name] + [normalize(v) for v in (d.name_variants or [])])
+    d._norm_cities = frozenset(_norm_key(loc.city) for loc in locs if loc.city)
+    d._norm_states = frozenset(_norm_key(loc.state) for loc in locs if loc.state)
+    d._norm_ins = tuple(ins)
+    d._norm_langs = tuple(_norm_key(l) for l in (d.languages or []))
+
+    ins_list = []
+    for ins in (d.insurances or []):
+        parts = []
+        if ins.payer_name: parts.append(ins.payer_name)
+        if ins.plan: parts.append(f"({ins.plan})")
+        ins_list.append(sys.intern(" ".join(parts) if parts else ins.payer_code or ""))
+    d._ins_strings = ins_list
+    d._appt_dump = {
+        "phone": d.appointment.phone if d.appointment else None,
+        "online_portals": [{"type": p.type, "url": p.url} for p in (d.appointment.online_portals or [])] if d.appointment else []
+    }
+    if d.locations:
+        d._loc0 = {"clinic_name": d.locations[0].clinic_name, "city": d.locations[0].city, "state": d.locations[0].state}
+    return d
+
+# -----------------------
+# Inverted indexes
+# -----------------------
+
+@dataclass
+class SearchIndex:
+    # Posting lists map a key to positions in Corpus.doctors. Specialties are
+    # keyed by their exact name; every other key is normalized.
+    specialty_to_ids: Dict[str, Set[int]]
+    city_to_ids: Dict[str, Set[int]]
+    state_to_ids: Dict[str, Set[int]]
+    insurance_to_ids: Dict[str, Set[int]]
+    language_to_ids: Dict[str, Set[int]]
+    # Normalized specialty names and mapping conditions -> (specialties, mapped specialties)
+    matcher: ahocorasick.Automaton
+    # Column layout of the feature matrices below: posting key -> column, in posting-dict order
+    specialty_cols: Dict[str, int]
+    city_cols: Dict[str, int]
+    state_cols: Dict[str, int]
+    insurance_cols: Dict[str, int]
+    language_cols: Dict[str, int]
+    # One row per doctor: how often it lists each specialty, and which filter keys it has
+    specialty_counts: np.ndarray
+    city_mask: np.ndarray
+    state_mask: np.ndarray
+    insurance_mask: np.ndarray
+    language_mask: np.ndarray
+    # Length of each doctor's normalized full name, the leading part of its _name_blob
+    name_lengths: np.ndarray
+    # Every normalized full name joined by "\x02", and where each one starts, for whole-corpus name scans
+    names_text: str
+    name_offsets: List[int]
+
+def build_indexes(doctors: List[Doctor], mapping: List[Dict[str, Any]]) -> SearchIndex:
+    specialty_to_ids = defaultdict(set)
+    city_to_ids = defaultdict(set)
+    state_to_ids = defaultdict(set)
+    insurance_to_ids = defaultdict(set)
+    language_to_ids = defaultdict(set)
+    for i, d in enumerate(doctors):
         for sp in d.specialties:
-            if normalize(sp) in qn:
-                specs.add(sp)
-    # otherwise use mapping by conditions/synonyms
-    if not specs:
-        for item in load_mapping():
-            for cond in item.get("condition", []):
-                if normalize(cond) and normalize(cond) in qn:
-                    for sp in item.get("specialties", []):
-                        specs.add(sp)
-    return list(specs)
-
-def doctor_matches_filters(d: Doctor, city: Optional[str], state: Optional[str],
-                           insurance: Optional[str], language: Optional[str]) -> bool:
-    if city:
-        if not any(normalize(loc.city) == normalize(city) for loc in (d.locations or []) if loc and loc.city):
-            return False
-    if state:
-        if not any(normalize(loc.state) == normalize(state) for loc in (d.locations or []) if loc and loc.state):
-            return False
-    if insurance:
-        ins_norm = normalize(insurance)
-        if not any(ins_norm in (normalize(i.payer_code) or "") or ins_norm in (normalize(i.payer_name) or "") for i in (d.insurances or [])):
-            return False
-    if language:
-        if not any(normalize(language) in normalize(l) for l in (d.languages or [])):
-            return False
-    return True
-
-def compute_score(d: Doctor, specs: List[str], q: str,
-                  city: Optional[str], state: Optional[str], insurance: Optional[str], language: Optional[str]) -> float:
-    score = 0.0
-    qn = normalize(q)
-    # Specialty match
+            specialty_to_ids[sp].add(i)
+        for city in d._norm_cities:
+            city_to_ids[city].add(i)
+        for state in d._norm_states:
+            state_to_ids[state].add(i)
+        for code, name in d._norm_ins:
+            insurance_to_ids[code].add(i)
+            insurance_to_ids[name].add(i)
+        for l in d._norm_langs:
+            language_to_ids[l].add(i)
+
+    specialty_cols = {sp: j for j, sp in enumerate(specialty_to_ids)}
+    specialty_counts = np.zeros((len(doctors), len(specialty_cols)), dtype=np.uint8)
+    for i, d in enumerate(doctors):
+        for sp in d.specialties:
+            specialty_counts[i, specialty_cols[sp]] += 1
+    city_cols, city_mask = _one_hot(city_to_ids, len(doctors))
+    state_cols, state_mask = _one_hot(state_to_ids, len(doctors))
+    insurance_cols, insurance_mask = _one_hot(insurance_to_ids, len(doctors))
+    language_cols, language_mask = _one_hot(language_to_ids, len(doctors))
+
+    return SearchIndex(
+        specialty_to_ids=dict(specialty_to_ids),
+        city_to_ids=dict(city_to_ids),
+        state_to_ids=dict(state_to_ids),
+        insurance_to_ids=dict(insurance_to_ids),
+        language_to_ids=dict(language_to_ids),
+        matcher=_build_matcher(specialty_to_ids, mapping),
+        specialty_cols=specialty_cols,
+        city_cols=city_cols,
+        state_cols=state_cols,
+        insurance_cols=insurance_cols,
+        language_cols=language_cols,
+        specialty_counts=specialty_counts,
+        city_mask=city_mask,
+        state_mask=state_mask,
+        insurance_mask=insurance_mask,
+        language_mask=language_mask,
+        name_lengths=np.array([len(d._norm_name) for d in doctors], dtype=np.int64),
+        names_text="\x02".join(d._norm_name for d in doctors),
+        name_offsets=_offsets(len(d._norm_name) + 1 for d in doctors),
+    )
+
+def _offsets(sizes: Iterable[int]) -> List[int]:
+    offsets, pos = [], 0
+    for size in sizes:
+        offsets.append(pos)
+        pos += size
+    return offsets
+
+def _one_hot(postings: Dict[str, Set[int]], n: int) -> Tuple[Dict[str, int], np.ndarray]:
+    cols = {key: j for j, key in enumerate(postings)}
+    mask = np.zeros((n, len(cols)), dtype=bool)
+    for key, j in cols.items():
+        mask[list(postings[key]), j] = True
+    return cols, mask
+
+def _build_matcher(specialties: Iterable[str], mapping: List[Dict[str, Any]]) -> ahocorasick.Automaton:
+    words = defaultdict(lambda: (set(), set()))
+    for sp in specialties:
+        sp_n = normalize(sp)
+        if sp_n:
+            words[sp_n][0].add(sp)
+    for item in mapping:
+        mapped = item.get("specialties", [])
+        for cond in item.get("condition", []):
+            cond_n = normalize(cond)
+            if cond_n:
+                words[cond_n][1].update(mapped)
+    matcher = ahocorasick.Automaton()
+    for word, (direct, mapped) in words.items():
+        matcher.add_word(word, (tuple(direct), tuple(mapped)))
+    if words:
+        matcher.make_automaton()
+    return matcher
+
+# -----------------------
+# Corpus
+# -----------------------
+
+# eq=False keeps identity hashing, so a corpus can be part of a cache key
+@dataclass(slots=True, eq=False)
+class Corpus:
+    doctors: List[Doctor]
+    mapping: List[Dict[str, Any]]
+    index: SearchIndex
+
+def load_corpus() -> Corpus:
+    doctors = load_doctors()
+    mapping = load_mapping()
+    return Corpus(doctors=doctors, mapping=mapping, index=build_indexes(doctors, mapping))
+
+# Loaded once at import; reload_data() swaps in a new one
+CORPUS = load_corpus()
+
+# -----------------------
+# Lookups
+# -----------------------
+
+def _postings_containing(index: Dict[str, Set[int]], needle: str) -> Set[int]:
+    # insurance and language filters are substring matches, so union every key that contains the needle
+    ids = set()
+    for key, posting in index.items():
+        if needle in key:
+            ids |= posting
+    return ids
+
+def _names_containing(index: SearchIndex, qn: str) -> Set[int]:
+    # one left-to-right scan of names_text, skipping to the next name after each hit
+    ids = set()
+    pos = index.names_text.find(qn)
+    while pos != -1:
+        i = bisect_right(index.name_offsets, pos) - 1
+        ids.add(i)
+        if i + 1 == len(index.name_offsets):
+            break
+        pos = index.names_text.find(qn, index.name_offsets[i + 1])
+    return ids
+
+def detect_specialties_from_query(q: str, corpus: Optional[Corpus] = None) -> List[str]:
+    return list(_detect_specialties(corpus or CORPUS, normalize(q)))
+
+# keyed on the corpus as well, so a lookup that races reload_data() cannot cache old-corpus results under a new key
+@lru_cache(maxsize=4096)
+def _detect_specialties(corpus: Corpus, qn: str) -> Tuple[str, ...]:
+    matcher = corpus.index.matcher
+    specs, mapped = set(), set()
+    # a single pass finds every specialty name and mapped condition in the query
+    if qn and len(matcher):
+        for _, (direct, via) in matcher.iter(qn):
+            specs.update(direct)
+            mapped.update(via)
+    # if q names a specialty directly use it, otherwise use mapping by conditions/synonyms
+    return tuple(specs or mapped)
+
+# -----------------------
+# Scoring
+# -----------------------
+
+def _key_columns(cols: Dict[str, int], needle: str, substring: bool = False) -> np.ndarray:
+    if substring:
+        return np.array([j for key, j in cols.items() if needle in key], dtype=np.intp)
+    return np.array([cols[needle]] if needle in cols else [], dtype=np.intp)
+
+_NO_COLS = np.zeros(0, dtype=np.intp)
+# Numba's default workqueue threading layer must not be entered from several threads at once,
+# and FastAPI runs sync endpoints on a thread pool
+_kernel_lock = threading.Lock()
+
+@njit
+def _has_any(mask, i, cols):
+    for c in cols:
+        if mask[i, c]:
+            return True
+    return False
+
+# compiled per process without cache=True: a cached parallel kernel records the module name it was first
+# imported under, and loading it under any other name fails at import
+@njit(parallel=True, nogil=True)
+def score_kernel(ids, specialty_counts, spec_cols, check_relevance, name_pos, query_len, name_lengths,
+                 city_mask, city_cols, state_mask, state_cols, insurance_mask, insurance_cols,
+                 language_mask, language_cols):
+    # Fused relevance + scoring pass over the candidate rows; an empty column list switches that term off.
+    # name_pos is where the query first occurs in each candidate's name blob (-1 if absent).
+    # Irrelevant rows score -inf; also returns how many rows were kept.
+    n = ids.shape[0]
+    scores = np.empty(n)
+    kept = 0
+    for k in prange(n):
+        i = ids[k]
+        hits = 0
+        for c in spec_cols:
+            hits += specialty_counts[i, c]
+        # the full name leads the blob, so a first hit that ends inside it is a full-name match
+        in_name = name_pos[k] >= 0 and name_pos[k] + query_len <= name_lengths[i]
+        if check_relevance and hits == 0 and not in_name:
+            scores[k] = -np.inf
+            continue
+        kept += 1
+        score = float(hits)
+        if query_len > 0 and name_pos[k] >= 0:
+            score += 0.5
+        if _has_any(city_mask, i, city_cols):
+            score += 0.3
+        if _has_any(state_mask, i, state_cols):
+            score += 0.2
+        if _has_any(insurance_mask, i, insurance_cols):
+            score += 0.4
+        if _has_any(language_mask, i, language_cols):
+            score += 0.2
+        scores[k] = score
+    return scores, kept
+
+def _warm_up_kernel():
+    # Compile at import instead of on the first request
+    row = np.zeros((1, 0), dtype=bool)
+    one = np.zeros(1, dtype=np.int64)
+    score_kernel(np.zeros(1, dtype=np.intp), np.zeros((1, 0), dtype=np.uint8), _NO_COLS, True, one, 0, one,
+                 row, _NO_COLS, row, _NO_COLS, row, _NO_COLS, row, _NO_COLS)
+
+_warm_up_kernel()
+
+def score_candidates(index: SearchIndex, doctors: List[Doctor], ids: np.ndarray, specs: List[str], qn: str,
+                     city: Optional[str], state: Optional[str], insurance: Optional[str],
+                     language: Optional[str]) -> Tuple[np.ndarray, int]:
+    # Scores every doctor in ids in one pass; returns (scores aligned with ids, number of relevant rows)
+    spec_cols = _NO_COLS
     if specs:
-        score += sum(1.0 for sp in d.specialties if sp in specs)
-    # Name/org keyword presence
-    if qn and (qn in normalize(d.full_name) or any(qn in normalize(v) for v in (d.name_variants or []))):
-        score += 0.5
+        spec_cols = np.array([index.specialty_cols[sp] for sp in specs if sp in index.specialty_cols], dtype=np.intp)
+    # Name/org keyword presence: one scan per candidate serves both the relevance test and the bonus.
+    # A query holding the separator could only match across two names of the blob
+    if (specs or qn) and "\x01" not in qn:
+        name_pos = np.fromiter((doctors[i]._name_blob.find(qn) for i in ids), dtype=np.int64, count=len(ids))
+    else:
+        name_pos = np.full(len(ids), -1, dtype=np.int64)
     # Filters
-    if city and any(normalize(loc.city) == normalize(city) for loc in (d.locations or []) if loc and loc.city):
-        score += 0.3
-    if state and any(normalize(loc.state) == normalize(state) for loc in (d.locations or []) if loc and loc.state):
-        score += 0.2
-    if insurance and any(normalize(insurance) in ((normalize(i.payer_code) or "") + " " + (normalize(i.payer_name) or "")) for i in (d.insurances or [])):
-        score += 0.4
-    if language and any(normalize(language) in normalize(l) for l in (d.languages or [])):
-        score += 0.2
-    return score
+    city_cols = _key_columns(index.city_cols, city) if city is not None else _NO_COLS
+    state_cols = _key_columns(index.state_cols, state) if state is not None else _NO_COLS
+    insurance_cols = _key_columns(index.insurance_cols, insurance, substring=True) if insurance is not None else _NO_COLS
+    language_cols = _key_columns(index.language_cols, language, substring=True) if language is not None else _NO_COLS
+
+    with _kernel_lock:
+        return score_kernel(ids, index.specialty_counts, spec_cols, bool(specs), name_pos, len(qn), index.name_lengths,
+                            index.city_mask, city_cols, index.state_mask, state_cols,
+                            index.insurance_mask, insurance_cols, index.language_mask, language_cols)
+
+def _rank(scores: np.ndarray, kept: int, offset: int, limit: int) -> np.ndarray:
+    # Positions of the `kept` finite scores after a stable descending sort, sliced [offset: offset + limit]
+    end = offset + limit
+    if 0 <= offset and 0 < end < kept:
+        # only the top `end` are needed: partition out everything below the end-th best score
+        threshold = -np.partition(-scores, end - 1)[end - 1]
+        top = np.flatnonzero(scores >= threshold)
+        order = top[np.argsort(-scores[top], kind="stable")]
+    else:
+        order = np.argsort(-scores, kind="stable")[:kept]
+    return order[offset: end]
+
+_ZH_WITH_SPECS = "根据您的查询“{q}”，建议首先考虑以下科室：{sp}。如出现胸痛、呼吸困难、晕厥等急症，请立刻拨打 911 或前往急诊。此信息仅供参考，不构成诊断。"
+_ZH_NO_SPECS = "未能从“{q}”明确识别科室。建议提供具体症状或已知诊断，并在紧急情况下拨打 911。此信息仅供参考，不构成诊断。"
+_EN_WITH_SPECS = "For your query '{q}', consider the following specialties: {sp}. If you have red-flag symptoms (e.g., chest pain, shortness of breath, syncope), call 911 or go to the ER. This is not medical advice."
+_EN_NO_SPECS = "Could not confidently map '{q}' to a specialty. Please provide more detail on symptoms or a known diagnosis. For emergencies, call 911. This is not medical advice."
 
 def triage_note(lang: str, q: str, specs: List[str]) -> str:
+    return _triage_note(lang, q, tuple(specs))
+
+@lru_cache(maxsize=2048)
+def _triage_note(lang: str, q: str, specs: Tuple[str, ...]) -> str:
     if lang == "zh":
-        if specs:
-            return f"根据您的查询“{q}”，建议首先考虑以下科室：{', '.join(specs)}。如出现胸痛、呼吸困难、晕厥等急症，请立刻拨打 911 或前往急诊。此信息仅供参考，不构成诊断。"
-        else:
-            return f"未能从“{q}”明确识别科室。建议提供具体症状或已知诊断，并在紧急情况下拨打 911。此信息仅供参考，不构成诊断。"
-    # default en
-    if specs:
-        return f"For your query '{q}', consider the following specialties: {', '.join(specs)}. If you have red-flag symptoms (e.g., chest pain, shortness of breath, syncope), call 911 or go to the ER. This is not medical advice."
-    else:
-        return f"Could not confidently map '{q}' to a specialty. Please provide more detail on symptoms or a known diagnosis. For emergencies, call 911. This is not medical advice."
+        template = _ZH_WITH_SPECS if specs else _ZH_NO_SPECS
+    else:  # default en
+        template = _EN_WITH_SPECS if specs else _EN_NO_SPECS
+    return template.format_map({"q": q, "sp": ", ".join(specs)})
 
 # -----------------------
 # Schemas for responses
 # -----------------------
 
-class DoctorCard(BaseModel):
+# The search endpoint serializes plain dicts with orjson; these models only document the schema
+
+class DoctorCard(FrozenModel):
     doctor_id: str
     name: str
     specialties: List[str]
@@ -164,13 +498,21 @@ class DoctorCard(BaseModel):
     insurances: List[str] = []
     appointment: Dict[str, Any] = {}
     location: Dict[str, Any] = {}
-    sources: List[Dict[str, Any]] = []
+    sources: List[Source] = []
     score: float
 
-class SearchResponse(BaseModel):
+class SearchResponse(FrozenModel):
     analysis: Dict[str, Any]
     doctors: List[DoctorCard]
 
+class ValidationError(FrozenModel):
+    loc: List[Union[str, int]] = Field(..., title="Location")
+    msg: str = Field(..., title="Message")
+    type: str = Field(..., title="Error Type")
+
+class HTTPValidationError(FrozenModel):
+    detail: List[ValidationError] = Field(default_factory=list, title="Detail")
+
 # -----------------------
 # Endpoints
 # -----------------------
@@ -179,62 +521,138 @@ class SearchResponse(BaseModel):
 def health():
     return {"status": "ok"}
 
-@app.get("/search/doctors", response_model=SearchResponse)
-def search_doctors(q: str = Query(..., description="Disease or specialty or free text"),
-                   city: Optional[str] = None,
-                   state: Optional[str] = None,
-                   zip: Optional[str] = None,
-                   insurance: Optional[str] = Query(None, description="payer_code or payer_name"),
-                   language: Optional[str] = Query(None, description="Preferred spoken language (e.g., Chinese, English)"),
-                   limit: int = 20,
-                   offset: int = 0,
-                   lang: str = Query("en", pattern="^(en|zh)$")):
+def _query_param(name: str, schema: Dict[str, Any], required: bool = False,
+                 description: Optional[str] = None) -> Dict[str, Any]:
+    schema = dict(schema)
+    if description:
+        schema["description"] = description
+    schema["title"] = name.capitalize()
+    param = {"name": name, "in": "query", "required": required, "schema": schema}
+    if description:
+        param["description"] = description
+    return param
 
-    doctors = load_doctors()
-    specs = detect_specialties_from_query(q)
+OPTIONAL_STRING = {"anyOf": [{"type": "string"}, {"type": "null"}]}
+
+# search_doctors reads its query string directly instead of through FastAPI's per-parameter
+# validation; this documents the parameters it accepts
+SEARCH_PARAMETERS = [
+    _query_param("q", {"type": "string"}, required=True, description="Disease or specialty or free text"),
+    _query_param("city", OPTIONAL_STRING),
+    _query_param("state", OPTIONAL_STRING),
+    _query_param("zip", OPTIONAL_STRING),
+    _query_param("insurance", OPTIONAL_STRING, description="payer_code or payer_name"),
+    _query_param("language", OPTIONAL_STRING, description="Preferred spoken language (e.g., Chinese, English)"),
+    _query_param("limit", {"type": "integer", "default": 20}),
+    _query_param("offset", {"type": "integer", "default": 0}),
+    _query_param("lang", {"type": "string", "pattern": "^(en|zh)$", "default": "en"}),
+]
 
-    # Filter
-    filtered = [d for d in doctors if doctor_matches_filters(d, city, state, insurance, language)]
+# The same Pydantic rules the signature parameters used (e.g. "1.0" is a valid int, "٣" is not)
+_INT_PARAM = TypeAdapter(int)
+_LANG_PARAM = TypeAdapter(Annotated[str, StringConstraints(pattern="^(en|zh)$")])
+
+def _query_value(adapter: TypeAdapter, qp: Any, name: str, default: Any, errors: List[Dict[str, Any]]) -> Any:
+    value = qp.get(name)
+    if value is None:
+        return default
+    try:
+        return adapter.validate_python(value)
+    except PydanticValidationError as e:
+        errors.extend({**err, "loc": ("query", name)} for err in e.errors(include_url=False))
+        return default
+
+@app.get("/search/doctors",
+         responses={200: {"model": SearchResponse},
+                    422: {"model": HTTPValidationError, "description": "Validation Error"}},
+         openapi_extra={"parameters": SEARCH_PARAMETERS})
+def search_doctors(request: Request):
+    qp = request.query_params
+    # checked in declaration order and reported together, like FastAPI's own query validation
+    errors = []
+    q = qp.get("q")
+    if q is None:
+        errors.append({"type": "missing", "loc": ("query", "q"), "msg": "Field required", "input": None})
+    limit = _query_value(_INT_PARAM, qp, "limit", 20, errors)
+    offset = _query_value(_INT_PARAM, qp, "offset", 0, errors)
+    lang = _query_value(_LANG_PARAM, qp, "lang", "en", errors)
+    if errors:
+        raise RequestValidationError(errors)
+    # zip is accepted but not used for matching yet, so it is not part of the cache key
+    body = render_search(CORPUS, q, _filter_key(qp.get("city")), _filter_key(qp.get("state")),
+                         _filter_key(qp.get("insurance")), _filter_key(qp.get("language")), limit, offset, lang)
+    return Response(content=body, media_type="application/json")
+
+def _filter_key(value: Optional[str]) -> Optional[str]:
+    return normalize(value) if value else None
+
+@lru_cache(maxsize=1024)
+def render_search(corpus: Corpus, q: str, city: Optional[str], state: Optional[str], insurance: Optional[str],
+                  language: Optional[str], limit: int, offset: int, lang: str) -> bytes:
+    # Filters arrive normalized, or None when not given; q stays raw because the triage note echoes it.
+    # The corpus snapshot is part of the key, so every lookup below reads the same one
+    doctors, index = corpus.doctors, corpus.index
+    qn = normalize(q)
+    specs = detect_specialties_from_query(q, corpus)
+
+    # Filter by intersecting the posting lists of every filter given
+    postings = []
+    if city is not None:
+        postings.append(index.city_to_ids.get(city, set()))
+    if state is not None:
+        postings.append(index.state_to_ids.get(state, set()))
+    if insurance is not None:
+        postings.append(_postings_containing(index.insurance_to_ids, insurance))
+    if language is not None:
+        postings.append(_postings_containing(index.language_to_ids, language))
+    if specs and qn:
+        # only doctors with a matching specialty or whose name contains the query are relevant
+        relevant = _names_containing(index, qn)
+        for sp in specs:
+            relevant |= index.specialty_to_ids.get(sp, set())
+        postings.append(relevant)
     # If no filters applied and query is free text, include all for scoring; else use filtered list
-    candidates = filtered if (city or state or insurance or language) else doctors
+    if postings:
+        # intersect the most selective posting list first so every later step scans less
+        postings.sort(key=len)
+        matched = set(postings[0])
+        for posting in postings[1:]:
+            if not matched:
+                break
+            matched &= posting
+        ids = np.array(sorted(matched), dtype=np.intp)
+    else:
+        ids = np.arange(len(doctors), dtype=np.intp)
 
     # Score and sort
-    scored = [
-        (compute_score(d, specs, q, city, state, insurance, language), d)
-        for d in candidates
-        if (not specs) or any(sp in d.specialties for sp in specs) or (normalize(q) in (normalize(d.full_name)))
-    ]
-    scored.sort(key=lambda x: x[0], reverse=True)
+    scores, kept = score_candidates(index, doctors, ids, specs, qn, city, state, insurance, language)
 
     rows = []
-    for score, d in scored[offset: offset + limit]:
-        ins_list = []
-        for ins in (d.insurances or []):
-            parts = []
-            if ins.payer_name: parts.append(ins.payer_name)
-            if ins.plan: parts.append(f"({ins.plan})")
-            ins_list.append(" ".join(parts) if parts else ins.payer_code or "")
-        appt = {
-            "phone": d.appointment.phone if d.appointment else None,
-            "online_portals": [{"type": p.type, "url": p.url} for p in (d.appointment.online_portals or [])] if d.appointment else []
-        }
-        loc = {}
-        if d.locations:
-            loc = {"clinic_name": d.locations[0].clinic_name, "city": d.locations[0].city, "state": d.locations[0].state}
-        rows.append(DoctorCard(
-            doctor_id=d.doctor_id,
-            name=f"{d.full_name}",
-            specialties=d.specialties,
-            languages=d.languages or [],
-            insurances=ins_list,
-            appointment=appt,
-            location=loc,
-            sources=[s.model_dump() for s in (d.sources or [])],
-            score=round(score, 3)
-        ))
+    page = _rank(scores, kept, offset, limit)
+    for d_id, score in zip(ids[page], np.round(scores[page], 3)):
+        d = doctors[d_id]
+        rows.append({
+            "doctor_id": d.doctor_id,
+            "name": d.full_name,
+            "specialties": d.specialties,
+            "languages": d.languages or [],
+            "insurances": d._ins_strings,
+            "appointment": d._appt_dump,
+            "location": d._loc0,
+            "sources": d.sources or [],
+            "score": score
+        })
 
     analysis = {
         "specialties": specs,
         "triage_note": triage_note(lang, q, specs)
     }
-    return SearchResponse(analysis=analysis, doctors=rows)
+    # scores stay NumPy floats; orjson writes them directly, as ORJSONResponse does for the other endpoints
+    return orjson.dumps({"analysis": analysis, "doctors": rows}, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def reload_data():
+    # Call after editing the data files: loads a fresh corpus and drops every result derived from the old one
+    global CORPUS
+    CORPUS = load_corpus()
+    _detect_specialties.cache_clear()
+    render_search.cache_clear()